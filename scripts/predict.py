@@ -8,17 +8,32 @@ import sys
 import argparse
 from pathlib import Path
 from datetime import datetime, timedelta
+from functools import lru_cache
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from model import load_model
+from features_predict import features_for_target
 
 
 METRICS_PATH = Path(__file__).parent.parent / "artifacts" / "daily_customer_metrics.parquet"
 
 
+def require_metrics() -> None:
+    """Raise a helpful error if the pipeline hasn't produced the metrics file yet."""
+    if not METRICS_PATH.exists():
+        raise FileNotFoundError(
+            f"Metrics file not found at {METRICS_PATH}. "
+            "Please run the pipeline first: python -m scripts.run_pipeline"
+        )
+
+
 def load_customer_data(customer_id: str, target_date: str) -> pd.DataFrame:
     """
     Load historical data for a customer up to the target date.
@@ -30,87 +45,122 @@ def load_customer_data(customer_id: str, target_date: str) -> pd.DataFrame:
     Returns:
         DataFrame with historical customer metrics
     """
-    if not METRICS_PATH.exists():
-        raise FileNotFoundError(
-            f"Metrics file not found at {METRICS_PATH}. "
-            "Please run the pipeline first: python -m scripts.run_pipeline"
-        )
+    require_metrics()
     
-    # Load all metrics
-    df = pd.read_parquet(METRICS_PATH)
-    df['date'] = pd.to_datetime(df['date'])
-    
-    # Filter for customer
-    customer_data = df[df['customer_id'] == customer_id].copy()
-    
-    if len(customer_data) == 0:
-        raise ValueError(f"No historical data found for customer {customer_id}")
-    
-    # Filter up to (but not including) target date
     target_dt = pd.to_datetime(target_date)
-    customer_data = customer_data[customer_data['date'] < target_dt]
+    
+    # Push customer and date filters into the Parquet reader so only matching
+    # row groups are read; the same Arrow compute expression then filters rows
+    # before anything is converted to pandas
+    is_customer = pc.field('customer_id') == customer_id
+    customer_data = pq.read_table(
+        METRICS_PATH,
+        filters=is_customer & (pc.field('date') < pa.scalar(target_dt))
+    ).to_pandas()
     
     if len(customer_data) == 0:
+        # Tell apart an unknown customer from one with no history before the date
+        known_customer = pq.read_table(
+            METRICS_PATH,
+            columns=['customer_id'],
+            filters=is_customer
+        ).num_rows > 0
+        
+        if not known_customer:
+            raise ValueError(f"No historical data found for customer {customer_id}")
+        
         raise ValueError(
             f"No historical data found for customer {customer_id} before {target_date}"
         )
     
+    customer_data['date'] = pd.to_datetime(customer_data['date'])
+    
     return customer_data
 
 
-def prepare_prediction_features(customer_data: pd.DataFrame, 
-                                target_date: str,
-                                feature_cols: list) -> pd.DataFrame:
+@lru_cache(maxsize=1)
+def get_model():
     """
-    Prepare features for prediction by engineering features on historical data.
+    Load the trained model once per process.
+    
+    Returns:
+        Tuple of (model, feature_cols, metrics), shared by later predictions
+    """
+    try:
+        return load_model()
+    except FileNotFoundError as e:
+        raise FileNotFoundError(
+            f"Model not found. Please run the pipeline first: python -m scripts.run_pipeline"
+        )
+
+
+def predict_from_histories(model, feature_cols: list, histories: list, target_dts: list) -> np.ndarray:
+    """
+    Compute target-day features for each history and predict them in one model call.
     
     Args:
-        customer_data: Historical customer metrics
-        target_date: Target prediction date
-        feature_cols: List of required feature columns
+        model: Trained model
+        feature_cols: Feature column names, in model order
+        histories: Non-empty customer histories before their target dates
+        target_dts: Target dates, aligned with histories
     
     Returns:
-        DataFrame with single row of features for prediction
+        1-D array of predictions
     """
-    from features import engineer_features
+    X = np.empty((len(histories), len(feature_cols)), dtype=np.float32)
+    for i, (history, target_dt) in enumerate(zip(histories, target_dts)):
+        X[i] = features_for_target(history, target_dt, feature_cols)
     
-    target_dt = pd.to_datetime(target_date)
+    return model.predict(pd.DataFrame(X, columns=feature_cols))
+
+
+def predict_many(pairs: list) -> pd.DataFrame:
+    """
+    Predict spending for many (customer, date) pairs with one metrics read
+    and one model call.
     
-    # Create a dummy row for target date to generate features
-    dummy_row = pd.DataFrame([{
-        'date': target_dt,
-        'customer_id': customer_data['customer_id'].iloc[0],
-        'orders': 0,  # Placeholder, not used in prediction
-        'items': 0,
-        'gross_gbp': 0,
-        'returns_gbp': 0,
-        'net_gbp': 0  # This is what we're predicting
-    }])
+    Args:
+        pairs: List of (customer_id, target_date) tuples, dates as YYYY-MM-DD
     
-    # Combine with historical data
-    combined = pd.concat([customer_data, dummy_row], ignore_index=True)
+    Returns:
+        DataFrame with customer_id, target_date and predicted_net_gbp, one row per pair
+    """
+    if not pairs:
+        return pd.DataFrame(columns=['customer_id', 'target_date', 'predicted_net_gbp'])
     
-    # Engineer features
-    featured = engineer_features(combined)
+    require_metrics()
+    model, feature_cols, _ = get_model()
     
-    # Get the last row (target date)
-    prediction_row = featured[featured['date'] == target_dt].copy()
+    customer_ids = [customer_id for customer_id, _ in pairs]
+    target_dts = [pd.to_datetime(target_date) for _, target_date in pairs]
     
-    # Check if all required features are present
-    missing_features = set(feature_cols) - set(prediction_row.columns)
-    if missing_features:
-        raise ValueError(f"Missing required features: {missing_features}")
+    # Single read covering every requested customer's history
+    metrics = pq.read_table(
+        METRICS_PATH,
+        filters=(pc.field('customer_id').isin(sorted(set(customer_ids)))
+                 & (pc.field('date') < pa.scalar(max(target_dts))))
+    ).to_pandas()
+    metrics['date'] = pd.to_datetime(metrics['date'])
+    histories = dict(tuple(metrics.groupby('customer_id', observed=True, sort=False)))
     
-    # Check for NaN values
-    feature_values = prediction_row[feature_cols]
-    if feature_values.isna().any().any():
-        nan_features = feature_values.columns[feature_values.isna().any()].tolist()
-        print(f"⚠️  Warning: Some features have NaN values: {nan_features}")
-        print("   This may occur if there's insufficient historical data.")
-        # Fill NaN with 0 (conservative approach)
-        feature_values = feature_values.fillna(0)
+    pair_histories = []
+    for (customer_id, target_date), target_dt in zip(pairs, target_dts):
+        history = histories.get(customer_id)
+        if history is not None:
+            history = history[history['date'] < target_dt]
+        
+        if history is None or len(history) == 0:
+            raise ValueError(
+                f"No historical data found for customer {customer_id} before {target_date}"
+            )
+        
+        pair_histories.append(history)
     
-    return feature_values
+    return pd.DataFrame({
+        'customer_id': customer_ids,
+        'target_date': [target_date for _, target_date in pairs],
+        'predicted_net_gbp': predict_from_histories(model, feature_cols, pair_histories, target_dts)
+    })
 
 
 def make_prediction(customer_id: str, target_date: str) -> dict:
@@ -124,22 +174,17 @@ def make_prediction(customer_id: str, target_date: str) -> dict:
     Returns:
         Dictionary with prediction results
     """
-    # Load model
-    try:
-        model, feature_cols, metrics = load_model()
-    except FileNotFoundError as e:
-        raise FileNotFoundError(
-            f"Model not found. Please run the pipeline first: python -m scripts.run_pipeline"
-        )
+    # Load model (cached after the first call)
+    model, feature_cols, metrics = get_model()
     
-    # Load customer data
+    # Load customer data (raises a specific error for unknown customers or
+    # missing history before the date)
     customer_data = load_customer_data(customer_id, target_date)
     
-    # Prepare features
-    X = prepare_prediction_features(customer_data, target_date, feature_cols)
-    
-    # Make prediction
-    prediction = model.predict(X)[0]
+    # Make prediction from the loaded history, sharing predict_many's feature path
+    prediction = predict_from_histories(
+        model, feature_cols, [customer_data], [pd.to_datetime(target_date)]
+    )[0]
     
     # Get historical context
     recent_avg = customer_data.tail(7)['net_gbp'].mean()
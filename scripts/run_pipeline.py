@@ -65,7 +65,7 @@ def main():
         print("=" * 60)
         print("\nGenerated artifacts:")
         print("  📊 artifacts/daily_customer_metrics.parquet")
-        print("  🤖 artifacts/model/random_forest_model.pkl")
+        print("  🤖 artifacts/model/gradient_boosting_model.pkl")
         print("  📋 artifacts/model/feature_columns.json")
         print("  📈 artifacts/model/metrics.json")
         print("\nNext steps:")
@@ -5,8 +5,21 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 
+try:
+    from .features_numba import rolling_agg, shifted_cumsum
+except ImportError:
+    from features_numba import rolling_agg, shifted_cumsum
 
-def create_temporal_features(df: pd.DataFrame) -> pd.DataFrame:
+
+# Rolling windows and lags in days (reduced for small datasets)
+ROLLING_WINDOWS = [3]
+LAGS = [1, 2]
+
+# Columns the sorted, per-customer feature steps read
+BASE_COLUMNS = ['date', 'customer_id', 'orders', 'items', 'net_gbp']
+
+
+def create_temporal_features(df: pd.DataFrame, new_cols: dict) -> None:
     """
     Create temporal features from date column.
     
@@ -14,17 +27,21 @@ def create_temporal_features(df: pd.DataFrame) -> pd.DataFrame:
     - day_of_week (0=Monday, 6=Sunday)
     - day_of_month
     - is_weekend
-    """
-    df = df.copy()
     
-    df['day_of_week'] = df['date'].dt.dayofweek
-    df['day_of_month'] = df['date'].dt.day
-    df['is_weekend'] = (df['day_of_week'] >= 5).astype(int)
+    Args:
+        df: DataFrame sorted by customer_id and date
+        new_cols: Dict that new feature arrays are written into
+    """
+    day_of_week = df['date'].dt.dayofweek.to_numpy(dtype=np.int8)
     
-    return df
+    new_cols['day_of_week'] = day_of_week
+    new_cols['day_of_month'] = df['date'].dt.day.to_numpy(dtype=np.int8)
+    new_cols['is_weekend'] = day_of_week >= 5
 
 
-def create_rolling_features(df: pd.DataFrame, windows: list = [3]) -> pd.DataFrame:
+def create_rolling_features(df: pd.DataFrame, new_cols: dict,
+                            starts: np.ndarray, ends: np.ndarray,
+                            windows: list = [3]) -> None:
     """
     Create rolling/lagged features for time series prediction.
     
@@ -35,66 +52,59 @@ def create_rolling_features(df: pd.DataFrame, windows: list = [3]) -> pd.DataFra
     - rolling_sum_orders: total orders
     
     Args:
-        df: DataFrame with date and customer_id
+        df: DataFrame sorted by customer_id and date
+        new_cols: Dict that new feature arrays are written into
+        starts, ends: Per-customer row offsets (see get_group_boundaries)
         windows: List of window sizes in days (reduced to [3] for small datasets)
     """
-    df = df.copy()
-    df = df.sort_values(['customer_id', 'date'])
-    
-    for window in windows:
-        # Rolling aggregations per customer
-        df[f'rolling_{window}d_mean_net'] = df.groupby('customer_id')['net_gbp'].transform(
-            lambda x: x.shift(1).rolling(window=window, min_periods=1).mean()
-        )
-        
-        df[f'rolling_{window}d_std_net'] = df.groupby('customer_id')['net_gbp'].transform(
-            lambda x: x.shift(1).rolling(window=window, min_periods=1).std()
-        )
-        
-        df[f'rolling_{window}d_max_net'] = df.groupby('customer_id')['net_gbp'].transform(
-            lambda x: x.shift(1).rolling(window=window, min_periods=1).max()
-        )
-        
-        df[f'rolling_{window}d_sum_orders'] = df.groupby('customer_id')['orders'].transform(
-            lambda x: x.shift(1).rolling(window=window, min_periods=1).sum()
-        )
-    
-    # Fill NaN values
+    values_net = df['net_gbp'].to_numpy(dtype=np.float32)
+    values_orders = df['orders'].to_numpy(dtype=np.float32)
+
     for window in windows:
-        df[f'rolling_{window}d_mean_net'] = df[f'rolling_{window}d_mean_net'].fillna(0)
-        df[f'rolling_{window}d_std_net'] = df[f'rolling_{window}d_std_net'].fillna(0)
-        df[f'rolling_{window}d_max_net'] = df[f'rolling_{window}d_max_net'].fillna(0)
-        df[f'rolling_{window}d_sum_orders'] = df[f'rolling_{window}d_sum_orders'].fillna(0)
-    
-    return df
+        # Single pass per customer computing all four rolling aggregations
+        # (accumulated in float64 inside the kernel, stored as float32)
+        out_mean = np.empty(len(df), dtype=np.float32)
+        out_std = np.empty(len(df), dtype=np.float32)
+        out_max = np.empty(len(df), dtype=np.float32)
+        out_sum = np.empty(len(df), dtype=np.float32)
+        rolling_agg(values_net, values_orders, starts, ends, window,
+                    out_mean, out_std, out_max, out_sum)
 
+        # The kernel writes 0 where there is no history, so no NaN fill
+        new_cols[f'rolling_{window}d_mean_net'] = out_mean
+        new_cols[f'rolling_{window}d_std_net'] = out_std
+        new_cols[f'rolling_{window}d_max_net'] = out_max
+        new_cols[f'rolling_{window}d_sum_orders'] = out_sum
 
-def create_lag_features(df: pd.DataFrame, lags: list = [1, 2]) -> pd.DataFrame:
+
+def create_lag_features(df: pd.DataFrame, new_cols: dict,
+                        starts: np.ndarray, ends: np.ndarray,
+                        lags: list = [1, 2]) -> None:
     """
     Create lagged features (previous day values).
     
     Args:
         df: DataFrame sorted by customer_id and date
+        new_cols: Dict that new feature arrays are written into
+        starts, ends: Per-customer row offsets (see get_group_boundaries)
         lags: List of lag periods in days (reduced to [1, 2] for small datasets)
     """
-    df = df.copy()
-    df = df.sort_values(['customer_id', 'date'])
-    
-    for lag in lags:
-        df[f'lag_{lag}d_net_gbp'] = df.groupby('customer_id')['net_gbp'].shift(lag)
-        df[f'lag_{lag}d_orders'] = df.groupby('customer_id')['orders'].shift(lag)
-        df[f'lag_{lag}d_items'] = df.groupby('customer_id')['items'].shift(lag)
-    
-    # Fill NaN with 0 for customers with insufficient history
-    for lag in lags:
-        df[f'lag_{lag}d_net_gbp'] = df[f'lag_{lag}d_net_gbp'].fillna(0)
-        df[f'lag_{lag}d_orders'] = df[f'lag_{lag}d_orders'].fillna(0)
-        df[f'lag_{lag}d_items'] = df[f'lag_{lag}d_items'].fillna(0)
+    # Position of each row within its customer's history
+    positions = np.arange(len(df)) - np.repeat(starts, ends - starts)
     
-    return df
+    for col in ['net_gbp', 'orders', 'items']:
+        values = df[col].to_numpy(dtype=np.float32)
+        
+        for lag in lags:
+            shifted = np.zeros(len(df), dtype=np.float32)
+            shifted[lag:] = values[:len(df) - lag]
+            # Fill with 0 for customers with insufficient history
+            shifted[positions < lag] = 0
+            new_cols[f'lag_{lag}d_{col}'] = shifted
 
 
-def create_customer_lifetime_features(df: pd.DataFrame) -> pd.DataFrame:
+def create_customer_lifetime_features(df: pd.DataFrame, new_cols: dict,
+                                      starts: np.ndarray, ends: np.ndarray) -> None:
     """
     Create customer lifetime statistics (up to current date).
     
@@ -103,55 +113,73 @@ def create_customer_lifetime_features(df: pd.DataFrame) -> pd.DataFrame:
     - customer_total_spend: cumulative spending
     - customer_days_active: days since first purchase
     - customer_avg_order_value: average spending per order
-    """
-    df = df.copy()
-    df = df.sort_values(['customer_id', 'date'])
     
-    # Cumulative metrics (excluding current day)
-    df['customer_total_orders'] = df.groupby('customer_id')['orders'].cumsum().shift(1)
-    df['customer_total_spend'] = df.groupby('customer_id')['net_gbp'].cumsum().shift(1)
+    Args:
+        df: DataFrame sorted by customer_id and date
+        new_cols: Dict that new feature arrays are written into
+        starts, ends: Per-customer row offsets (see get_group_boundaries)
+    """
+    # Cumulative metrics (excluding current day, 0 on a customer's first day)
+    total_orders = np.empty(len(df), dtype=np.float32)
+    total_spend = np.empty(len(df), dtype=np.float32)
+    shifted_cumsum(df['orders'].to_numpy(dtype=np.float32), starts, ends, total_orders)
+    shifted_cumsum(df['net_gbp'].to_numpy(dtype=np.float32), starts, ends, total_spend)
     
     # Days since first purchase
-    df['first_purchase_date'] = df.groupby('customer_id')['date'].transform('first')
-    df['customer_days_active'] = (df['date'] - df['first_purchase_date']).dt.days
-    
-    # Average order value
-    df['customer_avg_order_value'] = df['customer_total_spend'] / df['customer_total_orders'].clip(lower=1)
-    
-    # Fill NaN for first occurrences
-    df['customer_total_orders'] = df['customer_total_orders'].fillna(0)
-    df['customer_total_spend'] = df['customer_total_spend'].fillna(0)
-    df['customer_avg_order_value'] = df['customer_avg_order_value'].fillna(0)
+    dates = df['date'].to_numpy()
+    first_purchase_date = np.repeat(dates[starts], ends - starts)
     
-    df.drop(columns=['first_purchase_date'], inplace=True)
+    new_cols['customer_total_orders'] = total_orders
+    new_cols['customer_total_spend'] = total_spend
+    new_cols['customer_days_active'] = ((dates - first_purchase_date) // np.timedelta64(1, 'D')).astype(np.int32)
     
-    return df
+    # Average order value
+    new_cols['customer_avg_order_value'] = total_spend / np.maximum(total_orders, 1)
 
 
-def create_derived_features(df: pd.DataFrame) -> pd.DataFrame:
+def create_derived_features(df: pd.DataFrame, new_cols: dict) -> None:
     """
     Create derived features from existing metrics.
     
     Features:
     - avg_items_per_order: items / orders
     - returns_ratio: returns_gbp / gross_gbp
-    """
-    df = df.copy()
     
+    Args:
+        df: Daily customer metrics DataFrame
+        new_cols: Dict that new feature arrays are written into
+    """
     # Average items per order
-    df['avg_items_per_order'] = df['items'] / df['orders'].clip(lower=1)
+    new_cols['avg_items_per_order'] = (df['items'] / df['orders'].clip(lower=1)).to_numpy(dtype=np.float32)
     
     # Returns ratio (handle division by zero)
-    df['returns_ratio'] = (df['returns_gbp'] / df['gross_gbp'].clip(lower=0.01)).fillna(0)
-    df['returns_ratio'] = df['returns_ratio'].clip(upper=0)  # Should be negative or zero
+    returns_ratio = (df['returns_gbp'] / df['gross_gbp'].clip(lower=0.01)).fillna(0)
+    new_cols['returns_ratio'] = returns_ratio.clip(upper=0).to_numpy(dtype=np.float32)  # Should be negative or zero
+
+
+def get_group_boundaries(codes: np.ndarray) -> tuple:
+    """
+    Locate each customer's contiguous block of rows.
     
-    return df
+    Args:
+        codes: Integer customer codes of a frame sorted by customer_id and date
+    
+    Returns:
+        Tuple of (starts, ends) row offsets, one entry per customer
+    """
+    starts = np.flatnonzero(np.diff(codes, prepend=-1))
+    ends = np.r_[starts[1:], len(codes)]
+    return starts, ends
 
 
 def engineer_features(df: pd.DataFrame) -> pd.DataFrame:
     """
     Main feature engineering pipeline.
     
+    The frame is narrowed to BASE_COLUMNS and sorted once; each feature step
+    writes its columns into a shared dict which is attached, together with
+    the remaining input columns, in a single assign at the end.
+    
     Args:
         df: Daily customer metrics DataFrame
     
@@ -165,24 +193,40 @@ def engineer_features(df: pd.DataFrame) -> pd.DataFrame:
     initial_cols = len(df.columns)
     print(f"Initial features: {initial_cols}")
     
-    # Sort by customer and date
-    df = df.sort_values(['customer_id', 'date']).reset_index(drop=True)
+    df = df.reset_index(drop=True)
+    
+    # Derived features are row-wise, so compute them before narrowing the frame
+    print("\n🔧 Creating derived features...")
+    derived_cols = {}
+    create_derived_features(df, derived_cols)
+    other_cols = {col: df[col].to_numpy() for col in df.columns if col not in BASE_COLUMNS}
+    
+    # Sort only the columns the remaining steps need, by customer and date,
+    # with one lexsort on integer keys (customer codes, date as int64)
+    codes, _ = pd.factorize(df['customer_id'], sort=True)
+    order = np.lexsort((df['date'].to_numpy().view('i8'), codes))
+    df = df[BASE_COLUMNS].take(order).reset_index(drop=True)
+    starts, ends = get_group_boundaries(codes[order])
+    new_cols = {}
     
     # Create features
-    print("\n🔧 Creating temporal features...")
-    df = create_temporal_features(df)
+    print("🔧 Creating temporal features...")
+    create_temporal_features(df, new_cols)
     
     print("🔧 Creating rolling features...")
-    df = create_rolling_features(df, windows=[3])
+    create_rolling_features(df, new_cols, starts, ends, windows=ROLLING_WINDOWS)
     
     print("🔧 Creating lag features...")
-    df = create_lag_features(df, lags=[1, 2])
+    create_lag_features(df, new_cols, starts, ends, lags=LAGS)
     
     print("🔧 Creating customer lifetime features...")
-    df = create_customer_lifetime_features(df)
+    create_customer_lifetime_features(df, new_cols, starts, ends)
+    
+    # Re-attach the other input columns and derived features in sorted order
+    for name, values in {**other_cols, **derived_cols}.items():
+        new_cols[name] = values[order]
     
-    print("🔧 Creating derived features...")
-    df = create_derived_features(df)
+    df = df.assign(**new_cols)
     
     final_cols = len(df.columns)
     new_features = final_cols - initial_cols
@@ -205,7 +249,7 @@ def get_feature_columns() -> list:
     temporal_features = ['day_of_week', 'day_of_month', 'is_weekend']
     
     rolling_features = []
-    for window in [3]:  # Reduced for small datasets
+    for window in ROLLING_WINDOWS:
         rolling_features.extend([
             f'rolling_{window}d_mean_net',
             f'rolling_{window}d_std_net',
@@ -214,7 +258,7 @@ def get_feature_columns() -> list:
         ])
     
     lag_features = []
-    for lag in [1, 2]:  # Reduced for small datasets
+    for lag in LAGS:
         lag_features.extend([
             f'lag_{lag}d_net_gbp',
             f'lag_{lag}d_orders',
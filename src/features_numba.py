@@ -0,0 +1,81 @@
+"""
+Numba kernels for per-customer feature engineering.
+
+All kernels operate on flat arrays sorted by (customer_id, date), with each
+customer occupying the contiguous slice [group_starts[g], group_ends[g]).
+"""
+import numpy as np
+from numba import njit, prange
+
+
+@njit(parallel=True, cache=True)
+def rolling_agg(values_net, values_orders, group_starts, group_ends, window,
+                out_mean, out_std, out_max, out_sum):
+    """
+    Shifted rolling mean/std/max of net spend and sum of orders per customer.
+
+    For row i the window covers the previous `window` rows of the same
+    customer (the current day is excluded), matching
+    `x.shift(1).rolling(window, min_periods=1)`. Rows with no history get 0,
+    as does the std of a single-value window, so no NaN fill is needed.
+    """
+    for g in prange(group_starts.shape[0]):
+        start = group_starts[g]
+        end = group_ends[g]
+
+        # Running sums over the window [lo, i); std comes from the sum and
+        # sum of squares, so only the max needs to look at the window
+        s_net = 0.0
+        s_net2 = 0.0
+        s_orders = 0.0
+        lo = start
+
+        for i in range(start, end):
+            if i > start:
+                x = np.float64(values_net[i - 1])
+                s_net += x
+                s_net2 += x * x
+                s_orders += values_orders[i - 1]
+            if i - lo > window:
+                x = np.float64(values_net[lo])
+                s_net -= x
+                s_net2 -= x * x
+                s_orders -= values_orders[lo]
+                lo += 1
+
+            n = i - lo
+            if n == 0:
+                out_mean[i] = 0.0
+                out_std[i] = 0.0
+                out_max[i] = 0.0
+                out_sum[i] = 0.0
+                continue
+
+            out_mean[i] = s_net / n
+            out_sum[i] = s_orders
+
+            if n > 1:
+                out_std[i] = np.sqrt(max(0.0, (s_net2 - s_net * s_net / n) / (n - 1)))
+            else:
+                out_std[i] = 0.0
+
+            peak = values_net[lo]
+            for j in range(lo + 1, i):
+                if values_net[j] > peak:
+                    peak = values_net[j]
+            out_max[i] = peak
+
+
+@njit(parallel=True, cache=True)
+def shifted_cumsum(values, group_starts, group_ends, out):
+    """
+    Per-customer cumulative sum excluding the current row.
+
+    The first row of each customer gets 0, matching a within-group
+    `cumsum().shift(1).fillna(0)`.
+    """
+    for g in prange(group_starts.shape[0]):
+        total = 0.0
+        for i in range(group_starts[g], group_ends[g]):
+            out[i] = total
+            total += values[i]
@@ -0,0 +1,81 @@
+"""
+Single-row feature computation for prediction.
+
+Produces the same values engineer_features gives the target-date row of a
+customer (history plus an empty target day), computed directly from the
+history arrays without grouping, sorting all customers or building frames.
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    from .features import ROLLING_WINDOWS, LAGS
+except ImportError:
+    from features import ROLLING_WINDOWS, LAGS
+
+
+def features_for_target(history: pd.DataFrame, target_date, feature_cols: list) -> np.ndarray:
+    """
+    Compute the feature vector for one customer on a target date.
+
+    The target day's own activity is unknown, so its base and derived
+    features are 0. Rolling and lag features only look at the last few days
+    of history; lifetime features sum over all of it.
+
+    Args:
+        history: Customer's daily metrics before target_date (non-empty)
+        target_date: Target prediction date
+        feature_cols: Feature column names, in model order
+
+    Returns:
+        1-D float32 array of feature values ordered as feature_cols
+    """
+    history = history.sort_values('date')
+    target_dt = pd.Timestamp(target_date)
+
+    net = history['net_gbp'].to_numpy(dtype=np.float64)
+    orders = history['orders'].to_numpy(dtype=np.float64)
+    items = history['items'].to_numpy(dtype=np.float64)
+
+    features = {
+        # Base features of the (unknown) target day
+        'orders': 0.0,
+        'items': 0.0,
+
+        # Temporal
+        'day_of_week': target_dt.dayofweek,
+        'day_of_month': target_dt.day,
+        'is_weekend': target_dt.dayofweek >= 5,
+    }
+
+    # Rolling windows over the previous days
+    for window in ROLLING_WINDOWS:
+        recent_net = net[-window:]
+        n = len(recent_net)
+        features[f'rolling_{window}d_mean_net'] = recent_net.mean() if n > 0 else 0.0
+        features[f'rolling_{window}d_std_net'] = recent_net.std(ddof=1) if n > 1 else 0.0
+        features[f'rolling_{window}d_max_net'] = recent_net.max() if n > 0 else 0.0
+        features[f'rolling_{window}d_sum_orders'] = orders[-window:].sum()
+
+    # Lags (0 with insufficient history)
+    for lag in LAGS:
+        for col, values in [('net_gbp', net), ('orders', orders), ('items', items)]:
+            features[f'lag_{lag}d_{col}'] = values[-lag] if len(values) >= lag else 0.0
+
+    # Lifetime
+    total_orders = orders.sum()
+    total_spend = net.sum()
+    features['customer_total_orders'] = total_orders
+    features['customer_total_spend'] = total_spend
+    features['customer_days_active'] = (target_dt - history['date'].iloc[0]).days
+    features['customer_avg_order_value'] = total_spend / max(total_orders, 1)
+
+    # Derived from the target day's base features
+    features['avg_items_per_order'] = 0.0
+    features['returns_ratio'] = 0.0
+
+    missing_features = set(feature_cols) - set(features)
+    if missing_features:
+        raise ValueError(f"Missing required features: {missing_features}")
+
+    return np.array([features[col] for col in feature_cols], dtype=np.float32)
@@ -2,8 +2,19 @@
 Data ingestion module for downloading and loading transaction data from GCS.
 """
 import os
+import hashlib
+import threading
+from email.utils import formatdate, parsedate_to_datetime
 import requests
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from pathlib import Path
 from typing import List, Tuple
 from datetime import datetime, timedelta
@@ -11,26 +22,120 @@ from datetime import datetime, timedelta
 
 BASE_URL = "https://storage.googleapis.com/tech-test-file-storage"
 DATA_DIR = Path(__file__).parent.parent / "data"
+CACHE_DIR = DATA_DIR / ".cache"
+RAW_CACHE_DIR = CACHE_DIR / "raw"
+MAX_DOWNLOAD_WORKERS = 16
+DOWNLOAD_CHUNK_SIZE = 1 << 16
 
+_print_lock = threading.Lock()
 
-def download_file(url: str, local_path: Path) -> bool:
-    """Download a file from URL if it doesn't exist locally."""
+# Known transaction schema (see schema.md); currency is dictionary-encoded.
+# quantity is read as float64 and timestamps as strings; both are checked and
+# converted during validation so a bad value doesn't fail the whole file
+TRANSACTION_SCHEMA = pa.schema([
+    ('invoice_id', pa.string()),
+    ('customer_id', pa.string()),
+    ('country', pa.string()),
+    ('currency', pa.dictionary(pa.int32(), pa.string())),
+    ('product_id', pa.string()),
+    ('product_category', pa.string()),
+    ('description', pa.string()),
+    ('quantity', pa.float64()),
+    ('unit_price', pa.float64()),
+    ('timestamp', pa.string()),
+])
+
+# Columns used by preprocessing and transformation; the rest are never materialized
+TRANSACTION_COLUMNS = [
+    'invoice_id', 'customer_id', 'currency', 'product_id',
+    'description', 'quantity', 'unit_price', 'timestamp'
+]
+
+# Bump when the layout of cached per-file tables changes in a way the schema
+# and TRANSACTION_COLUMNS don't capture (e.g. how file_date is derived)
+RAW_CACHE_VERSION = 1
+
+
+def log(message: str) -> None:
+    """Print a whole line at once; downloads report from worker threads."""
+    with _print_lock:
+        print(message)
+
+
+def create_session() -> requests.Session:
+    """
+    Create an HTTP session that pools and reuses connections across downloads.
+    
+    Connection errors and transient responses (429, 5xx) are retried with backoff.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=2 * MAX_DOWNLOAD_WORKERS,
+        max_retries=Retry(
+            total=2,
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET", "HEAD")
+        )
+    )
+    session.mount("https://", adapter)
+    return session
+
+
+def download_file(url: str, local_path: Path, session: requests.Session = None) -> bool:
+    """
+    Download a file from URL, revalidating an existing local copy.
+    
+    A local copy is sent as If-Modified-Since (its mtime, which is set to the
+    server's Last-Modified on download); a 304 keeps it, so only re-published
+    files are fetched again. If the server cannot be reached, the local copy
+    is used as is.
+    """
+    headers = {}
     if local_path.exists():
-        print(f"✓ File already exists: {local_path.name}")
-        return True
+        headers['If-Modified-Since'] = formatdate(local_path.stat().st_mtime, usegmt=True)
     
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        
-        local_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(local_path, 'wb') as f:
-            f.write(response.content)
+        with (session or requests).get(url, headers=headers, timeout=30, stream=True) as response:
+            if response.status_code == 304:
+                log(f"✓ File already exists: {local_path.name} (not modified)")
+                return True
+            response.raise_for_status()
+            
+            # Stream to a temporary file so an interrupted download never
+            # leaves a partial file that looks cached on the next run
+            local_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = local_path.with_suffix(local_path.suffix + '.part')
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+            
+            last_modified = response.headers.get('Last-Modified')
+            if last_modified:
+                modified_ts = parsedate_to_datetime(last_modified).timestamp()
+                os.utime(tmp_path, (modified_ts, modified_ts))
+            tmp_path.replace(local_path)
         
-        print(f"✓ Downloaded: {local_path.name}")
+        log(f"✓ {'Updated' if headers else 'Downloaded'}: {local_path.name}")
         return True
     except requests.exceptions.RequestException as e:
-        print(f"✗ Failed to download {url}: {e}")
+        if local_path.exists():
+            log(f"⚠️  Could not revalidate {local_path.name}, using local copy: {e}")
+            return True
+        log(f"✗ Failed to download {url}: {e}")
+        return False
+
+
+def file_available(url: str, local_path: Path, session: requests.Session = None) -> bool:
+    """Check whether a file exists locally or on the server (HEAD only, no body)."""
+    if local_path.exists():
+        return True
+    
+    try:
+        response = (session or requests).head(url, timeout=10)
+        return response.status_code == 200
+    except requests.exceptions.RequestException:
         return False
 
 
@@ -39,7 +144,10 @@ def download_fx_rates() -> pd.DataFrame:
     url = f"{BASE_URL}/fx_rates.csv"
     local_path = DATA_DIR / "fx_rates.csv"
     
-    if download_file(url, local_path):
+    with create_session() as session:
+        downloaded = download_file(url, local_path, session=session)
+    
+    if downloaded:
         df = pd.read_csv(local_path)
         df['date'] = pd.to_datetime(df['date'])
         print(f"✓ Loaded FX rates: {len(df)} rows")
@@ -56,6 +164,8 @@ def discover_and_download_daily_files(start_date: str = "2024-10-01",
     
     Automatically discovers new files by trying sequential dates until files are no longer found.
     This supports incremental data ingestion as new daily files appear over time.
+    Dates are probed with concurrent HEAD requests and the confirmed files are
+    downloaded in parallel over a shared, connection-pooling session.
     
     Args:
         start_date: Start date in YYYY-MM-DD format
@@ -68,9 +178,9 @@ def discover_and_download_daily_files(start_date: str = "2024-10-01",
     start = datetime.strptime(start_date, "%Y-%m-%d")
     end = datetime.strptime(end_date, "%Y-%m-%d") if end_date else None
     
-    downloaded_files = []
-    current_date = start
-    consecutive_failures = 0
+    def daily_file(date: datetime) -> Tuple[str, Path]:
+        date_str = date.strftime("%Y-%m-%d")
+        return f"{BASE_URL}/data/{date_str}.csv", DATA_DIR / f"{date_str}.csv"
     
     if end_date:
         print(f"\n📥 Discovering files from {start_date} to {end_date}...")
@@ -78,65 +188,147 @@ def discover_and_download_daily_files(start_date: str = "2024-10-01",
         print(f"\n📥 Auto-discovering files starting from {start_date}...")
         print(f"  Will stop after {max_attempts} consecutive days without files")
     
-    while True:
-        # Stop if we've reached the end date
-        if end and current_date > end:
-            break
-        
-        # Stop if we've had too many consecutive failures (no more new files)
-        if consecutive_failures >= max_attempts:
-            print(f"  Stopped after {max_attempts} consecutive missing files")
-            break
-        
-        date_str = current_date.strftime("%Y-%m-%d")
-        url = f"{BASE_URL}/data/{date_str}.csv"
-        local_path = DATA_DIR / f"{date_str}.csv"
-        
-        if download_file(url, local_path):
-            downloaded_files.append(local_path)
-            consecutive_failures = 0  # Reset counter on success
+    with create_session() as session, ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as executor:
+        if end:
+            candidate_dates = [start + timedelta(days=i) for i in range((end - start).days + 1)]
         else:
-            consecutive_failures += 1
-            if not end_date:  # Only print this in auto-discover mode
-                if consecutive_failures == 1:
-                    print(f"  Last available file: {(current_date - timedelta(days=1)).strftime('%Y-%m-%d')}")
+            # Probe upcoming dates in concurrent batches, then apply the
+            # consecutive-miss rule in date order
+            candidate_dates = []
+            current_date = start
+            consecutive_failures = 0
+            
+            while consecutive_failures < max_attempts:
+                batch = [current_date + timedelta(days=i) for i in range(MAX_DOWNLOAD_WORKERS)]
+                found = executor.map(lambda d: file_available(*daily_file(d), session=session), batch)
+                
+                for date, available in zip(batch, found):
+                    if available:
+                        candidate_dates.append(date)
+                        consecutive_failures = 0  # Reset counter on success
+                        continue
+                    
+                    consecutive_failures += 1
+                    if consecutive_failures == 1:
+                        print(f"  Last available file: {(date - timedelta(days=1)).strftime('%Y-%m-%d')}")
+                    # Stop if we've had too many consecutive failures (no more new files)
+                    if consecutive_failures >= max_attempts:
+                        print(f"  Stopped after {max_attempts} consecutive missing files")
+                        break
+                
+                current_date += timedelta(days=MAX_DOWNLOAD_WORKERS)
         
-        current_date += timedelta(days=1)
-    
-    print(f"\n✓ Total files available: {len(downloaded_files)}")
-    print(f"  Date range: {downloaded_files[0].stem} to {downloaded_files[-1].stem}")
+        # Download the confirmed range in parallel over the shared session
+        pairs = [daily_file(date) for date in candidate_dates]
+        results = executor.map(lambda pair: download_file(*pair, session=session), pairs)
+        downloaded_files = [local_path for (_, local_path), ok in zip(pairs, results) if ok]
     
     if len(downloaded_files) == 0:
         raise ValueError("No transaction files found. Check GCS bucket availability.")
     
+    print(f"\n✓ Total files available: {len(downloaded_files)}")
+    print(f"  Date range: {downloaded_files[0].stem} to {downloaded_files[-1].stem}")
+    
     return downloaded_files
 
 
+def table_to_frame(table: pa.Table, source_key: str = None) -> pd.DataFrame:
+    """
+    Convert the combined Arrow table to pandas.
+    
+    customer_id becomes categorical so every downstream groupby works on
+    integer codes instead of hashing strings. source_key (None when the
+    data is incomplete and must not be cached) is stored in df.attrs.
+    """
+    df = table.to_pandas(self_destruct=True)
+    df['customer_id'] = df['customer_id'].astype('category')
+    if source_key is not None:
+        df.attrs['source_key'] = source_key
+    return df
+
+
+def source_cache_key(file_paths: List[Path]) -> str:
+    """Fingerprint a set of source files by name, size and modification time,
+    plus the schema, column projection and cache layout they are read with."""
+    h = hashlib.blake2b(digest_size=8)
+    h.update(TRANSACTION_SCHEMA.to_string().encode())
+    h.update(f"{','.join(TRANSACTION_COLUMNS)}:file_date:v{RAW_CACHE_VERSION}\n".encode())
+    for p in sorted(file_paths):
+        stat = p.stat()
+        h.update(f"{p.name}:{stat.st_size}:{int(stat.st_mtime)}\n".encode())
+    return h.hexdigest()
+
+
 def load_transaction_files(file_paths: List[Path]) -> pd.DataFrame:
     """
     Load and combine multiple transaction CSV files.
     
     Supports incremental loading - can process both cached and newly downloaded files.
+    Files are scanned as a PyArrow dataset, in parallel threads, reading only
+    the columns the pipeline uses. Each parsed file is cached as Parquet under
+    data/.cache/raw, keyed on its name, size and mtime, so a run with new
+    daily files only parses those. The key of the whole file set is exposed as
+    df.attrs['source_key'] so later stages can key their own caches on it.
     """
-    dfs = []
+    # Lazy dataset over all files; each file is scanned once, projected to the
+    # needed columns, so only those are converted
+    csv_format = ds.CsvFileFormat(
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=1 << 22),
+        convert_options=pacsv.ConvertOptions(strings_can_be_null=True)
+    )
+    dataset = ds.dataset([str(p) for p in file_paths], schema=TRANSACTION_SCHEMA, format=csv_format)
+    RAW_CACHE_DIR.mkdir(parents=True, exist_ok=True)
     
-    for file_path in file_paths:
+    def read_fragment(fragment) -> Tuple[pa.Table, bool]:
+        file_path = Path(fragment.path)
+        cache_path = RAW_CACHE_DIR / f"{file_path.stem}-{source_cache_key([file_path])}.parquet"
+        if cache_path.exists():
+            try:
+                return pq.read_table(cache_path), True
+            except Exception as e:
+                log(f"⚠️  Ignoring unreadable cache {cache_path.name}: {e}")
+        
         try:
-            df = pd.read_csv(file_path)
-            # Extract date from filename
-            date_str = file_path.stem  # e.g., "2024-10-01"
-            df['file_date'] = date_str
-            dfs.append(df)
+            table = fragment.to_table(schema=dataset.schema, columns=TRANSACTION_COLUMNS)
         except Exception as e:
-            print(f"✗ Error loading {file_path}: {e}")
+            log(f"✗ Error loading {file_path}: {e}")
+            return None, False
+        # Extract date from filename, dictionary-encoded: one string per file
+        date_str = file_path.stem  # e.g., "2024-10-01"
+        file_date = pa.DictionaryArray.from_arrays(
+            pa.array(np.zeros(table.num_rows, dtype=np.int32)), pa.array([date_str])
+        )
+        table = table.append_column('file_date', file_date)
+        
+        # Write to a temporary file first so an interrupted write never leaves
+        # a truncated file under the cache name, then replace any cache of an
+        # earlier version of this file
+        tmp_path = cache_path.with_suffix('.part')
+        pq.write_table(table, tmp_path, compression='zstd')
+        for stale in RAW_CACHE_DIR.glob(f"{file_path.stem}-*.parquet"):
+            stale.unlink()
+        tmp_path.replace(cache_path)
+        return table, False
     
-    if not dfs:
+    # Arrow parses without holding the GIL, so files are read in parallel
+    # threads (results keep file order)
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = list(executor.map(read_fragment, dataset.get_fragments()))
+    tables = [table for table, _ in results if table is not None]
+    cached = sum(from_cache for _, from_cache in results)
+    
+    if not tables:
         raise ValueError("No transaction files loaded successfully")
     
-    combined = pd.concat(dfs, ignore_index=True)
-    print(f"✓ Loaded {len(combined):,} total transaction rows from {len(dfs)} files")
+    combined = pa.concat_tables(tables)
+    print(f"✓ Loaded {combined.num_rows:,} total transaction rows from {len(tables)} files "
+          f"({cached} from cache)")
+    
+    # Only key downstream caches on complete data, so a failed file is retried next run
+    if len(tables) == len(file_paths):
+        return table_to_frame(combined, source_cache_key(file_paths))
     
-    return combined
+    return table_to_frame(combined)
 
 
 def load_all_data(end_date: str = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
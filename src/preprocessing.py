@@ -1,105 +1,122 @@
 """
 Data preprocessing module for cleaning and normalizing transaction data.
 """
+import hashlib
 import pandas as pd
 import numpy as np
+from pathlib import Path
 
 
-def deduplicate_transactions(df: pd.DataFrame) -> pd.DataFrame:
+CACHE_DIR = Path(__file__).parent.parent / "data" / ".cache"
+
+
+def preprocessed_cache_path(source_key: str) -> Path:
+    """
+    Cache file for preprocessed transactions.
+    
+    Keyed on the raw source files (see ingestion.source_cache_key) and on this
+    module's code, so editing a cleaning rule invalidates the cache.
+    """
+    code_key = hashlib.blake2b(Path(__file__).read_bytes(), digest_size=8).hexdigest()
+    return CACHE_DIR / f"clean-{source_key}-{code_key}.parquet"
+
+
+def deduplicate_transactions(df: pd.DataFrame, keep: np.ndarray) -> np.ndarray:
     """
     Remove duplicate transaction rows.
     
     Deduplication criteria: Same invoice_id, product_id, timestamp, quantity, unit_price
     Keep first occurrence.
+    
+    Returns:
+        keep mask with duplicate rows cleared
     """
     print("\n🔍 Deduplicating transactions...")
-    initial_count = len(df)
+    initial_count = keep.sum()
     
     # Define columns to check for duplicates
     duplicate_cols = ['invoice_id', 'product_id', 'timestamp', 'quantity', 'unit_price']
     
-    # Keep first occurrence
-    df_clean = df.drop_duplicates(subset=duplicate_cols, keep='first')
+    # Keep first occurrence (duplicated() hashes Arrow-backed strings natively; see commit for benchmarks)
+    keep = keep & ~df.duplicated(subset=duplicate_cols, keep='first').to_numpy()
     
-    duplicates_removed = initial_count - len(df_clean)
+    duplicates_removed = initial_count - keep.sum()
     print(f"✓ Removed {duplicates_removed} duplicate rows ({duplicates_removed/initial_count*100:.2f}%)")
     
-    return df_clean
+    return keep
 
 
-def handle_missing_customer_id(df: pd.DataFrame) -> pd.DataFrame:
+def handle_missing_customer_id(df: pd.DataFrame, keep: np.ndarray) -> np.ndarray:
     """
     Handle missing customer_id values.
     
     Strategy: Drop rows with missing customer_id (typically ~2% of data).
     Alternative could be to create synthetic IDs, but this may skew per-customer predictions.
+    
+    Returns:
+        keep mask with rows missing customer_id cleared
     """
     print("\n🔍 Handling missing customer_id...")
-    initial_count = len(df)
+    initial_count = keep.sum()
     
-    missing_count = df['customer_id'].isna().sum()
+    missing = df['customer_id'].isna().to_numpy() & keep
+    missing_count = missing.sum()
     print(f"  Missing customer_id: {missing_count} rows ({missing_count/initial_count*100:.2f}%)")
     
     # Drop rows with missing customer_id
-    df_clean = df.dropna(subset=['customer_id']).copy()
+    keep = keep & ~missing
     
-    removed = initial_count - len(df_clean)
-    print(f"✓ Dropped {removed} rows with missing customer_id")
+    print(f"✓ Dropped {missing_count} rows with missing customer_id")
     
-    return df_clean
+    return keep
 
 
-def handle_missing_unit_price(df: pd.DataFrame) -> pd.DataFrame:
+def handle_missing_unit_price(df: pd.DataFrame, keep: np.ndarray) -> np.ndarray:
     """
     Handle missing unit_price values.
     
     Strategy: Impute using median price per product+currency+day.
     If no median available for that combination, use global product median.
     Drop rows where imputation is not possible.
+    
+    Medians only use rows still in keep. unit_price is imputed in place.
+    
+    Returns:
+        keep mask with rows that could not be imputed cleared
     """
     print("\n🔍 Handling missing unit_price...")
-    initial_missing = df['unit_price'].isna().sum()
-    print(f"  Missing unit_price: {initial_missing} rows ({initial_missing/len(df)*100:.2f}%)")
+    missing = df['unit_price'].isna().to_numpy() & keep
+    initial_missing = missing.sum()
+    print(f"  Missing unit_price: {initial_missing} rows ({initial_missing/keep.sum()*100:.2f}%)")
     
     if initial_missing == 0:
         print("✓ No missing unit_price values")
-        return df
-    
-    df_clean = df.copy()
+        return keep
     
-    # Calculate median price per product, currency, and date
-    df_clean['price_key'] = df_clean['product_id'] + '_' + df_clean['currency'] + '_' + df_clean['file_date']
+    # Median of known prices per product+currency+date, and per product overall
+    known_price = df['unit_price'].where(keep)
+    price_key_median = known_price.groupby(
+        [df['product_id'], df['currency'], df['file_date']], observed=True, sort=False
+    ).transform('median')
+    product_median = known_price.groupby(
+        df['product_id'], observed=True, sort=False
+    ).transform('median')
     
     # First try: impute with product+currency+date median
-    for idx in df_clean[df_clean['unit_price'].isna()].index:
-        price_key = df_clean.loc[idx, 'price_key']
-        product_id = df_clean.loc[idx, 'product_id']
-        
-        # Get median for same product+currency+date
-        same_key_prices = df_clean[(df_clean['price_key'] == price_key) & 
-                                     (df_clean['unit_price'].notna())]['unit_price']
-        
-        if len(same_key_prices) > 0:
-            df_clean.loc[idx, 'unit_price'] = same_key_prices.median()
-        else:
-            # Fallback: use product median across all dates/currencies
-            product_prices = df_clean[(df_clean['product_id'] == product_id) & 
-                                       (df_clean['unit_price'].notna())]['unit_price']
-            if len(product_prices) > 0:
-                df_clean.loc[idx, 'unit_price'] = product_prices.median()
-    
-    df_clean.drop(columns=['price_key'], inplace=True)
+    # Fallback: use product median across all dates/currencies
+    df['unit_price'] = df['unit_price'].fillna(price_key_median).fillna(product_median)
     
     # Drop any remaining rows with missing unit_price
-    remaining_missing = df_clean['unit_price'].isna().sum()
+    unimputed = df['unit_price'].isna().to_numpy() & keep
+    remaining_missing = unimputed.sum()
     if remaining_missing > 0:
-        df_clean = df_clean.dropna(subset=['unit_price'])
+        keep = keep & ~unimputed
         print(f"  Could not impute {remaining_missing} rows, dropped them")
     
     imputed = initial_missing - remaining_missing
     print(f"✓ Imputed {imputed} missing unit_price values, dropped {remaining_missing}")
     
-    return df_clean
+    return keep
 
 
 def handle_missing_description(df: pd.DataFrame) -> pd.DataFrame:
@@ -120,40 +137,71 @@ def handle_missing_description(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def validate_data(df: pd.DataFrame) -> pd.DataFrame:
+def validate_data(df: pd.DataFrame, keep: np.ndarray) -> np.ndarray:
     """
     Validate data types and ranges.
     
     - Ensure currencies are valid (GBP, USD, EUR)
+    - Ensure quantity is present and a whole number
     - Ensure timestamps are parseable
     - Remove rows with zero unit_price
+    
+    Timestamps are parsed in place.
+    
+    Returns:
+        keep mask with invalid rows cleared
     """
     print("\n🔍 Validating data...")
-    initial_count = len(df)
+    initial_count = keep.sum()
     
     # Validate currencies
     valid_currencies = ['GBP', 'USD', 'EUR']
-    invalid_currency = ~df['currency'].isin(valid_currencies)
+    invalid_currency = ~df['currency'].isin(valid_currencies).to_numpy() & keep
     if invalid_currency.sum() > 0:
         print(f"  Removing {invalid_currency.sum()} rows with invalid currency")
-        df = df[~invalid_currency].copy()
+        keep = keep & ~invalid_currency
+    
+    # Remove rows with missing quantity
+    missing_quantity = df['quantity'].isna().to_numpy() & keep
+    if missing_quantity.sum() > 0:
+        print(f"  Removing {missing_quantity.sum()} rows with missing quantity")
+        keep = keep & ~missing_quantity
+    
+    # Remove rows with a non-integral quantity (read as float, e.g. 2.5)
+    fractional_quantity = (df['quantity'] % 1 != 0).to_numpy() & keep
+    if fractional_quantity.sum() > 0:
+        print(f"  Removing {fractional_quantity.sum()} rows with non-integral quantity")
+        keep = keep & ~fractional_quantity
     
     # Remove rows with zero or negative unit_price
-    invalid_price = df['unit_price'] <= 0
+    invalid_price = (df['unit_price'] <= 0).to_numpy() & keep
     if invalid_price.sum() > 0:
         print(f"  Removing {invalid_price.sum()} rows with invalid unit_price (<=0)")
-        df = df[~invalid_price].copy()
+        keep = keep & ~invalid_price
     
-    # Parse timestamps
-    df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-    invalid_timestamp = df['timestamp'].isna()
+    # Parse timestamps (ISO 8601 fast path, no per-row format inference)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601', errors='coerce', cache=True)
+    invalid_timestamp = df['timestamp'].isna().to_numpy() & keep
     if invalid_timestamp.sum() > 0:
         print(f"  Removing {invalid_timestamp.sum()} rows with invalid timestamp")
-        df = df[~invalid_timestamp].copy()
+        keep = keep & ~invalid_timestamp
     
-    removed = initial_count - len(df)
+    removed = initial_count - keep.sum()
     print(f"✓ Validation complete, removed {removed} invalid rows")
     
+    return keep
+
+
+def downcast_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Narrow column types for the aggregation stage.
+    
+    currency becomes categorical so FX lookups and groupbys work on integer
+    codes, and quantity (validated as whole numbers) becomes int32. unit_price
+    stays float64 so monetary values are not rounded before conversion.
+    """
+    df['currency'] = df['currency'].astype('category').cat.remove_unused_categories()
+    df['quantity'] = df['quantity'].astype('int32')
     return df
 
 
@@ -161,6 +209,10 @@ def preprocess_transactions(df: pd.DataFrame) -> pd.DataFrame:
     """
     Main preprocessing pipeline.
     
+    When the raw data carries a source key (df.attrs['source_key']), the
+    result is cached and reused while the source files and this module
+    are unchanged.
+    
     Args:
         df: Raw transaction DataFrame
     
@@ -171,20 +223,54 @@ def preprocess_transactions(df: pd.DataFrame) -> pd.DataFrame:
     print("DATA PREPROCESSING")
     print("=" * 60)
     
+    source_key = df.attrs.get('source_key')
+    cache_path = preprocessed_cache_path(source_key) if source_key else None
+    
+    if cache_path is not None and cache_path.exists():
+        try:
+            cached = pd.read_parquet(cache_path)
+        except Exception as e:
+            print(f"⚠️  Ignoring unreadable cache {cache_path.name}: {e}")
+        else:
+            print(f"✓ Loaded {len(cached):,} preprocessed rows from cache")
+            print("=" * 60)
+            return cached
+    
     initial_count = len(df)
     print(f"Initial rows: {initial_count:,}")
     
+    # Each step clears rows from a shared keep mask (value fixes are made in
+    # place on a shallow copy), so the frame is compacted once at the end
+    df = df.copy(deep=False)
+    keep = np.ones(len(df), dtype=bool)
+    
     # Apply preprocessing steps
-    df = deduplicate_transactions(df)
-    df = handle_missing_customer_id(df)
-    df = handle_missing_unit_price(df)
+    keep = deduplicate_transactions(df, keep)
+    keep = handle_missing_customer_id(df, keep)
+    keep = handle_missing_unit_price(df, keep)
+    keep = validate_data(df, keep)
+    # Boolean indexing copies the rows; the shallow copy detaches the result
+    # from its parent so the column assignments below don't trigger
+    # SettingWithCopyWarning on pandas without copy-on-write
+    df = df.loc[keep].copy(deep=False)
     df = handle_missing_description(df)
-    df = validate_data(df)
+    df = downcast_dtypes(df)
     
     final_count = len(df)
     removed_pct = (initial_count - final_count) / initial_count * 100
     
     print(f"\n✓ Final rows: {final_count:,} (removed {removed_pct:.2f}%)")
+    
+    if cache_path is not None:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so an interrupted write never
+        # leaves a truncated file under the cache name
+        tmp_path = cache_path.with_suffix('.part')
+        df.to_parquet(tmp_path, index=False, compression='zstd', row_group_size=1_000_000)
+        for stale in CACHE_DIR.glob("clean-*.parquet"):
+            stale.unlink()
+        tmp_path.replace(cache_path)
+    
     print("=" * 60)
     
     return df
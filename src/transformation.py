@@ -3,8 +3,15 @@ Data transformation module for currency conversion and aggregation.
 """
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pathlib import Path
 
+try:
+    from .transformation_numba import split_line_values
+except ImportError:
+    from transformation_numba import split_line_values
+
 
 def convert_to_gbp(df: pd.DataFrame, fx_rates: pd.DataFrame) -> pd.DataFrame:
     """
@@ -20,33 +27,43 @@ def convert_to_gbp(df: pd.DataFrame, fx_rates: pd.DataFrame) -> pd.DataFrame:
     print("\n💱 Converting currencies to GBP...")
     
     # Ensure date columns are datetime
-    df['date'] = pd.to_datetime(df['file_date'])
+    # file_date is categorical (one string per file), so each day parses once
+    df['date'] = df['file_date'].astype('datetime64[ns]')
     fx_rates['date'] = pd.to_datetime(fx_rates['date'])
     
-    # Merge with FX rates
-    df_with_fx = df.merge(
-        fx_rates[['date', 'currency', 'rate_to_gbp']],
-        on=['date', 'currency'],
-        how='left'
-    )
-    
-    # Check for missing FX rates
-    missing_fx = df_with_fx['rate_to_gbp'].isna().sum()
+    # Dense rate table over the (date, currency) categories present: one small
+    # reindex builds it, then each row's rate is a gather on the two category
+    # codes, with no per-row hashing or merge. GBP converts at 1.0.
+    file_date = df['file_date'].astype('category')
+    currency = df['currency'].astype('category')
+    table_dates = pd.to_datetime(file_date.cat.categories)
+    table_currencies = currency.cat.categories
+    
+    fx_map = (fx_rates.drop_duplicates(['date', 'currency'], keep='last')
+              .set_index(['date', 'currency'])['rate_to_gbp'])
+    rate_table = fx_map.reindex(
+        pd.MultiIndex.from_product([table_dates, table_currencies])
+    ).to_numpy(copy=True).reshape(len(table_dates), len(table_currencies))
+    rate_table[:, table_currencies == 'GBP'] = 1.0
+    
+    rate = rate_table[file_date.cat.codes.to_numpy(), currency.cat.codes.to_numpy()]
+    
+    # Check for missing FX rates (left as NaN)
+    missing_fx = np.isnan(rate).sum()
     if missing_fx > 0:
-        print(f"⚠️  Warning: {missing_fx} rows missing FX rates")
-        # For GBP, rate should be 1.0
-        df_with_fx.loc[(df_with_fx['currency'] == 'GBP') & 
-                       (df_with_fx['rate_to_gbp'].isna()), 'rate_to_gbp'] = 1.0
+        print(f"⚠️  Warning: {missing_fx} non-GBP rows missing FX rates")
+    
+    df['rate_to_gbp'] = rate
     
     # Calculate price in GBP
-    df_with_fx['price_gbp'] = df_with_fx['unit_price'] * df_with_fx['rate_to_gbp']
+    df['price_gbp'] = df['unit_price'].to_numpy() * rate
     
-    print(f"✓ Converted {len(df_with_fx)} rows to GBP")
+    print(f"✓ Converted {len(df)} rows to GBP")
     print(f"  Currency distribution:")
-    for currency in df_with_fx['currency'].value_counts().items():
+    for currency in df['currency'].value_counts().items():
         print(f"    {currency[0]}: {currency[1]:,} rows")
     
-    return df_with_fx
+    return df
 
 
 def aggregate_daily_customer_metrics(df: pd.DataFrame) -> pd.DataFrame:
@@ -70,29 +87,49 @@ def aggregate_daily_customer_metrics(df: pd.DataFrame) -> pd.DataFrame:
     """
     print("\n📊 Aggregating daily customer metrics...")
     
-    # Calculate total value in GBP for each row
-    df['value_gbp'] = df['quantity'] * df['price_gbp']
-    
-    # Separate positive (gross) and negative (returns) quantities
-    df['gross_value'] = df['value_gbp'].where(df['quantity'] > 0, 0)
-    df['returns_value'] = df['value_gbp'].where(df['quantity'] < 0, 0)
-    
-    # Group by date and customer
-    agg_metrics = df.groupby(['date', 'customer_id']).agg({
-        'invoice_id': 'nunique',           # distinct invoices
-        'quantity': lambda x: abs(x).sum(), # sum of absolute quantities
+    # Total value in GBP for each row, separated into positive (gross) and
+    # negative (returns) quantities, plus absolute quantity, in one pass
+    quantity = df['quantity'].to_numpy()
+    value_gbp = np.empty(len(df))
+    gross_value = np.empty(len(df))
+    returns_value = np.empty(len(df))
+    abs_qty = np.empty(len(df), dtype=quantity.dtype)
+    split_line_values(quantity, df['price_gbp'].to_numpy(),
+                      value_gbp, gross_value, returns_value, abs_qty)
+    df['value_gbp'] = value_gbp
+    df['gross_value'] = gross_value
+    df['returns_value'] = returns_value
+    df['abs_qty'] = abs_qty
+    
+    # Distinct invoices per date and customer: count the unique
+    # (date, customer, invoice) triples instead of a per-group nunique
+    keys = ['date', 'customer_id']
+    # (null invoice_ids are not counted, as with nunique)
+    invoices = df[keys + ['invoice_id']].dropna(subset=['invoice_id']).drop_duplicates()
+    orders = invoices.groupby(keys, observed=True, sort=False).size().rename('orders')
+    
+    # Group by date and customer (observed=True: only pairs that occur, not the
+    # full date x customer product of the categorical customer_id; sort=False:
+    # no key sort, save_metrics and feature engineering order rows themselves)
+    sums = df.groupby(keys, observed=True, sort=False).agg({
+        'abs_qty': 'sum',                   # sum of absolute quantities
         'gross_value': 'sum',               # gross revenue
         'returns_value': 'sum',             # returns (negative)
         'value_gbp': 'sum'                  # net revenue
-    }).reset_index()
+    })
+    agg_metrics = pd.concat([orders, sums], axis=1).reset_index()
     
     # Rename columns
     agg_metrics.columns = ['date', 'customer_id', 'orders', 'items', 
                            'gross_gbp', 'returns_gbp', 'net_gbp']
     
-    # Ensure proper data types
-    agg_metrics['orders'] = agg_metrics['orders'].astype(int)
-    agg_metrics['items'] = agg_metrics['items'].astype(int)
+    # Ensure proper data types (compact: counts fit int32, amounts are summed
+    # in float64 above and stored as float32)
+    agg_metrics['orders'] = agg_metrics['orders'].fillna(0).astype('int32')
+    agg_metrics['items'] = agg_metrics['items'].astype('int32')
+    agg_metrics[['gross_gbp', 'returns_gbp', 'net_gbp']] = (
+        agg_metrics[['gross_gbp', 'returns_gbp', 'net_gbp']].astype('float32')
+    )
     
     print(f"✓ Aggregated to {len(agg_metrics)} daily customer records")
     print(f"  Date range: {agg_metrics['date'].min()} to {agg_metrics['date'].max()}")
@@ -113,6 +150,11 @@ def save_metrics(df: pd.DataFrame, output_path: str = None) -> None:
     """
     Save aggregated metrics to Parquet file.
     
+    Rows are sorted by customer_id and date and written in small row groups,
+    so each group covers a narrow customer range. Predict-time filters such as
+    customer_id == 'C00042' (see scripts/predict.py) then skip every row group
+    whose customer_id min/max statistics exclude that customer.
+    
     Args:
         df: Aggregated metrics DataFrame
         output_path: Path to save file (defaults to artifacts/daily_customer_metrics.parquet)
@@ -123,7 +165,18 @@ def save_metrics(df: pd.DataFrame, output_path: str = None) -> None:
     output_path = Path(output_path)
     output_path.parent.mkdir(parents=True, exist_ok=True)
     
-    df.to_parquet(output_path, index=False, engine='pyarrow')
+    df = df.sort_values(['customer_id', 'date'])
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(
+        table,
+        output_path,
+        row_group_size=20_000,
+        data_page_size=1 << 20,
+        use_dictionary=True,
+        compression='zstd',
+        compression_level=6,
+        write_statistics=True
+    )
     print(f"\n💾 Saved metrics to: {output_path}")
     print(f"   File size: {output_path.stat().st_size / 1024:.2f} KB")
 